@@ -8,7 +8,10 @@ Correction de la parenthèse manquante (SyntaxError) + code complet.
 from __future__ import annotations
 
 import datetime as dt
+import os
 import random
+import shutil
+import tempfile
 from pathlib import Path
 from typing import Dict, List, Tuple
 
@@ -16,13 +19,21 @@ import openpyxl
 import pandas as pd
 import streamlit as st
 
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # pragma: no cover - repli openpyxl
+    CalamineWorkbook = None
+
 # ---------------------------------------------------------------------------
 # CONFIG
 # ---------------------------------------------------------------------------
 DATA_FILE = Path("Liste_membres_Train.xlsx")
 MEMBRES_SHEET = "Membres"
 TIRAGES_SHEET = "Tirages"
+MEMBRES_COLS = ["Pseudo", "Motif sortie", "Date du train", "Rang"]
+TIRAGES_COLS = ["Semaine", "Date", "Titulaire", "Suppléant"]
 WEEKS_AHEAD = 52
+_WEEK_OFFSETS = tuple(dt.timedelta(days=i) for i in range(7))
 
 # ---------------------------------------------------------------------------
 # STREAMLIT COMPAT
@@ -44,6 +55,27 @@ def _rerun():
 # DATE HELPERS
 # ---------------------------------------------------------------------------
 
+_JOURS = ("lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche")
+
+
+def _as_date(v) -> dt.date | None:
+    if pd.isna(v):
+        return None
+    if isinstance(v, dt.datetime):
+        return v.date()
+    if isinstance(v, dt.date):
+        return v
+    try:
+        return dt.date.fromisoformat(str(v)[:10])
+    except ValueError:
+        ts = pd.to_datetime(v, dayfirst=True, errors="coerce")
+        return None if pd.isna(ts) else ts.date()
+
+
+def _day_label(d: dt.date) -> str:
+    return f"{_JOURS[d.weekday()]} {d:%d/%m/%Y}"
+
+
 def _week_id(d: dt.date) -> str:
     y, w, _ = d.isocalendar()
     return f"{y}-W{w:02d}"
@@ -53,10 +85,19 @@ def _monday(d: dt.date) -> dt.date:
     return d - dt.timedelta(days=d.weekday())
 
 
-def _next_mondays(n: int = WEEKS_AHEAD) -> List[dt.date]:
-    start = _monday(dt.date.today() + dt.timedelta(days=7))
+def _week_dates(monday: dt.date) -> List[dt.date]:
+    return [monday + off for off in _WEEK_OFFSETS]
+
+
+def _next_mondays(today: dt.date, n: int = WEEKS_AHEAD) -> List[dt.date]:
+    start = _monday(today + dt.timedelta(days=7))
     return [start + dt.timedelta(weeks=i) for i in range(n)]
 
+
+def _week_options(today: dt.date, taken: frozenset[str]) -> Dict[dt.date, str]:
+    ids = {m: _week_id(m) for m in _next_mondays(today)}
+    return {m: wid for m, wid in ids.items() if wid not in taken}
+
 # ---------------------------------------------------------------------------
 # EXCEL I/O
 # ---------------------------------------------------------------------------
@@ -68,64 +109,161 @@ def _open_wb() -> openpyxl.Workbook:
     return openpyxl.load_workbook(DATA_FILE)
 
 
-def _write_df(df: pd.DataFrame, sheet: str):
-    with pd.ExcelWriter(DATA_FILE, engine="openpyxl", mode="a", if_sheet_exists="replace") as w:
-        df.to_excel(w, index=False, sheet_name=sheet)
+def _save_wb(wb: openpyxl.Workbook):
+    fd, tmp = tempfile.mkstemp(dir=DATA_FILE.parent, suffix=".xlsx"); os.close(fd)
+    try:
+        wb.save(tmp)
+        shutil.copymode(DATA_FILE, tmp)
+        os.replace(tmp, DATA_FILE)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _calamine_cell(v):
+    if v == "":
+        return None
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    if isinstance(v, dt.date) and not isinstance(v, dt.datetime):
+        return dt.datetime.combine(v, dt.time())
+    return v
+
+
+def _sheet_rows(path: str, names: Tuple[str, ...]) -> Dict[str, List[tuple]]:
+    if CalamineWorkbook is not None:
+        wb = CalamineWorkbook.from_path(path)
+        return {
+            n: [tuple(map(_calamine_cell, r)) for r in wb.get_sheet_by_name(n).to_python()]
+            for n in names if n in wb.sheet_names
+        }
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        return {n: list(wb[n].values) for n in names if n in wb.sheetnames}
+    finally:
+        wb.close()
+
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def _read_sheets(path: str, mtime_ns: int, size: int) -> Dict[str, pd.DataFrame]:
+    sheets = _sheet_rows(path, (MEMBRES_SHEET, TIRAGES_SHEET))
+    out = {}
+    for name, cols in ((MEMBRES_SHEET, MEMBRES_COLS), (TIRAGES_SHEET, TIRAGES_COLS)):
+        if name not in sheets:
+            continue
+        rows = iter(sheets[name])
+        head = next(rows, ())
+        keep = [i for i, h in enumerate(head) if h in cols]
+        data = [[r[i] for i in keep] for r in rows]
+        out[name] = pd.DataFrame(data, columns=[head[i] for i in keep]).dropna(how="all")
+    if "Semaine" in out.get(TIRAGES_SHEET, ()):
+        out[TIRAGES_SHEET]["Semaine"] = out[TIRAGES_SHEET]["Semaine"].astype(str).str.strip()
+    return out
+
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def _file_bytes(path: str, mtime_ns: int, size: int) -> bytes:
+    return Path(path).read_bytes()
+
+
+def _file_key() -> Tuple[str, int, int]:
+    try:
+        stat = DATA_FILE.stat()
+    except FileNotFoundError:
+        st.error(f"Fichier {DATA_FILE} introuvable.")
+        st.stop()
+    return str(DATA_FILE), stat.st_mtime_ns, stat.st_size
+
+
+def _read_sheet(sheet: str, key: Tuple[str, int, int]) -> pd.DataFrame | None:
+    return _read_sheets(*key).get(sheet)
 
 
-def _players_df() -> pd.DataFrame:
-    df = pd.read_excel(DATA_FILE, sheet_name=MEMBRES_SHEET, engine="openpyxl")
-    required = {"Pseudo", "Motif sortie", "Date du train", "Rang"}
-    missing = required - set(df.columns)
+def _players_df(key: Tuple[str, int, int]) -> pd.DataFrame:
+    df = _read_sheet(MEMBRES_SHEET, key)
+    if df is None:
+        st.error(f"Feuille {MEMBRES_SHEET} introuvable.")
+        st.stop()
+    missing = set(MEMBRES_COLS) - set(df.columns)
     if missing:
         st.error("Colonnes manquantes : " + ", ".join(missing))
         st.stop()
     return df
 
 
-def _tirages_df() -> pd.DataFrame:
-    if TIRAGES_SHEET not in _open_wb().sheetnames:
-        return pd.DataFrame(columns=["Semaine", "Date", "Titulaire", "Suppléant"])
-    return pd.read_excel(DATA_FILE, sheet_name=TIRAGES_SHEET, engine="openpyxl")
+def _tirages_df(key: Tuple[str, int, int]) -> pd.DataFrame:
+    df = _read_sheet(TIRAGES_SHEET, key)
+    if df is None:
+        return pd.DataFrame(columns=TIRAGES_COLS)
+    return df
 
 
-def _save_tirages(rows: List[Tuple[str, str, str, str]]):
-    wb = _open_wb()
-    if TIRAGES_SHEET not in wb.sheetnames:
-        ws = wb.create_sheet(TIRAGES_SHEET)
-        ws.append(["Semaine", "Date", "Titulaire", "Suppléant"])
-    else:
-        ws = wb[TIRAGES_SHEET]
+def _tirages_ws(wb: openpyxl.Workbook):
+    if TIRAGES_SHEET in wb.sheetnames:
+        return wb[TIRAGES_SHEET]
+    ws = wb.create_sheet(TIRAGES_SHEET)
+    ws.append(TIRAGES_COLS)
+    return ws
+
+
+def _membres_cols(ws) -> Tuple[int, int]:
+    head = [c.value for c in ws[1]]
+    return head.index("Pseudo"), head.index("Date du train")
+
+
+def _save_tirages(wb: openpyxl.Workbook, rows: List[Tuple[str, dt.date, str, str]]):
+    ws = _tirages_ws(wb)
     for r in rows:
         ws.append(list(r))
-    wb.save(DATA_FILE)
+
+
+def _same(a, b) -> bool:
+    if _blank(a) and _blank(b):
+        return True
+    if isinstance(a, dt.datetime) and isinstance(b, dt.date) and not isinstance(b, dt.datetime):
+        a = a.date() if a.time() == dt.time() else a
+    return a == b
+
+
+def _replace_week(ws, wid: str, new_rows: List[Tuple[str, dt.date, str, str]]) -> bool:
+    old = list(ws.iter_rows(min_row=2, values_only=True))
+    first = next((i for i, r in enumerate(old) if str(r[0]).strip() == wid), len(old))
+    tail = [*new_rows, *(r for r in old[first:] if str(r[0]).strip() != wid)]
+    width = ws.max_column
+    changed = False
+    for i, r in enumerate(tail, start=first + 2):
+        for j, v in enumerate(tuple(r) + (None,) * (width - len(r)), start=1):
+            cell = ws.cell(row=i, column=j)
+            if not _same(cell.value, v):
+                cell.value = v; changed = True
+    end = first + 1 + len(tail)
+    if ws.max_row > end:
+        ws.delete_rows(end + 1, ws.max_row - end); changed = True
+    return changed
 
 # ---------------------------------------------------------------------------
 # STRING HELPERS
 # ---------------------------------------------------------------------------
 
+def _blank(v) -> bool:
+    return v is None or (isinstance(v, float) and v != v) or not str(v).strip()
+
+
 def _concat(base: str | float | None, new_dates: List[str]) -> str | None:
     if not new_dates:
         return base
-    existing = [] if pd.isna(base) or base is None or not str(base).strip() else [d.strip() for d in str(base).split(",")]
-    for d in new_dates:
-        if d not in existing:
-            existing.append(d)
-    return ", ".join(existing) if existing else None
+    merged = set() if _blank(base) else {d.strip() for d in str(base).split(",")}
+    merged.update(new_dates); merged.discard("")
+    return ", ".join(sorted(merged)) if merged else None
 
 
-def _strip_week(base: str | None, week_dates: set[dt.date]) -> str | None:
-    if pd.isna(base) or base is None or not str(base).strip():
+def _strip_week(base: str | None, week_isos: set[str]) -> str | None:
+    if _blank(base):
+        return base
+    parts = [part.strip() for part in str(base).split(",")]
+    kept = [p for p in parts if p not in week_isos]
+    if len(kept) == len(parts):
         return base
-    kept = []
-    for part in str(base).split(","):
-        p = part.strip()
-        try:
-            d = dt.date.fromisoformat(p)
-            if d not in week_dates:
-                kept.append(p)
-        except ValueError:
-            kept.append(p)
     return ", ".join(kept) if kept else None
 
 # ---------------------------------------------------------------------------
@@ -133,43 +271,47 @@ def _strip_week(base: str | None, week_dates: set[dt.date]) -> str | None:
 # ---------------------------------------------------------------------------
 
 def _eligible(df: pd.DataFrame) -> pd.DataFrame:
-    no_motif = df["Motif sortie"].fillna("").str.strip() == ""
-    not_r1 = df["Rang"].fillna("").astype(str).str.upper() != "R1"
-    return df[no_motif & not_r1]
+    f = df[["Motif sortie", "Rang"]].fillna("").astype(str)
+    return df[(f["Motif sortie"].str.strip() == "") & (f["Rang"].str.strip().str.upper() != "R1")]
 
 
-def _draw_week(df: pd.DataFrame, monday: dt.date) -> Dict[dt.date, Tuple[str, str]]:
-    dates = [monday + dt.timedelta(days=i) for i in range(7)]
-    pool = df["Pseudo"].tolist(); random.shuffle(pool)
-    used=set(); it=iter(pool); sched={}
-    for d in dates:
-        tit = next(p for p in it if p not in used); used.add(tit)
-        sup = next(p for p in it if p != tit)
-        sched[d]=(tit,sup)
-    return sched
+def _draw_week(df: pd.DataFrame, monday: dt.date, rng: random.Random) -> Dict[dt.date, Tuple[str, str]]:
+    dates = _week_dates(monday)
+    pool = df["Pseudo"].dropna().drop_duplicates().tolist()
+    if len(pool) < 2 * len(dates):
+        raise ValueError("Pas assez de joueurs éligibles")
+    picks = rng.sample(pool, 2 * len(dates))
+    return {d: (picks[2 * i], picks[2 * i + 1]) for i, d in enumerate(dates)}
 
 # ---------------------------------------------------------------------------
 # UPDATE DATES
 # ---------------------------------------------------------------------------
 
-def _update_dates(players: pd.DataFrame, dm: Dict[str, List[str]]):
-    players["Date du train"] = players.apply(lambda r: _concat(r["Date du train"], dm.get(r["Pseudo"], [])), axis=1)
-    _write_df(players, MEMBRES_SHEET)
+def _update_dates(wb: openpyxl.Workbook, dm: Dict[str, List[str]], week_dates: set[dt.date] | None = None) -> bool:
+    ws = wb[MEMBRES_SHEET]
+    ip, idt = _membres_cols(ws)
+    week_isos = {d.isoformat() for d in week_dates or ()}
+    changed = False
+    for row in ws.iter_rows(min_row=2):
+        cell = row[idt]
+        val = _strip_week(cell.value, week_isos) if week_isos else cell.value
+        val = _concat(val, dm.get(row[ip].value, []))
+        if val != cell.value:
+            cell.value = val; changed = True
+    return changed
 
 # ---------------------------------------------------------------------------
 # RESET
 # ---------------------------------------------------------------------------
 
 def _reset_all():
-    wb = _open_wb(); pdf = _players_df()
-    if TIRAGES_SHEET in wb.sheetnames:
-        ws = wb[TIRAGES_SHEET]
-        if ws.max_row > 1:
-            ws.delete_rows(2, ws.max_row)
-    else:
-        ws = wb.create_sheet(TIRAGES_SHEET); ws.append(["Semaine", "Date", "Titulaire", "Suppléant"])
-    pdf["Date du train"] = pd.NA
-    _write_df(pdf, MEMBRES_SHEET); wb.save(DATA_FILE)
+    wb = _open_wb(); ws = _tirages_ws(wb)
+    if ws.max_row > 1:
+        ws.delete_rows(2, ws.max_row)
+    ws_m = wb[MEMBRES_SHEET]; _, idt = _membres_cols(ws_m)
+    for row in ws_m.iter_rows(min_row=2, min_col=idt + 1, max_col=idt + 1):
+        row[0].value = None
+    _save_wb(wb)
 
 # ---------------------------------------------------------------------------
 # APP
@@ -179,34 +321,44 @@ st.set_page_config(page_title="Tirage train", page_icon="🎲", layout="centered
 
 st.title("🎲 Tirage au sort – Liste Train")
 
-players = _players_df()
+if st.sidebar.button("🔄 Recharger les joueurs"):
+    _read_sheets.clear(); _file_bytes.clear(); _rerun()
+
+file_key = _file_key()
+players = _players_df(file_key)
+all_tir = _tirages_df(file_key)
 
 # --- Génération ------------------------------------------------------------
 
 st.sidebar.header("Générer une semaine")
-exist_ids = set(_tirages_df()["Semaine"].astype(str).str.strip())
-week_opts = [m for m in _next_mondays() if _week_id(m) not in exist_ids]
+exist_ids = frozenset(all_tir["Semaine"])
+week_opts = _week_options(dt.date.today(), exist_ids)
 
 if week_opts:
-    monday_sel = st.sidebar.selectbox(
-        "Semaine", week_opts,
-        format_func=lambda d: f"{_week_id(d)} – {d.strftime('%d/%m/%Y')}"
-    )
-    if st.sidebar.button("🎲 Générer"):
-        if _week_id(monday_sel) in exist_ids:
+    with st.sidebar.form("gen_form"):
+        monday_sel = st.selectbox(
+            "Semaine", list(week_opts),
+            format_func=lambda d: f"{week_opts[d]} – {d.strftime('%d/%m/%Y')}"
+        )
+        generate = st.form_submit_button("🎲 Générer")
+    if generate:
+        wid_sel = week_opts[monday_sel]
+        if wid_sel in exist_ids:
             st.sidebar.warning("Cette semaine existe déjà.")
         else:
             elig = _eligible(players)
-            if len(elig) < 14:
+            if elig["Pseudo"].nunique() < 14:
                 st.sidebar.error("Pas assez de joueurs éligibles (≥14)")
             else:
-                sched = _draw_week(elig, monday_sel)
-                rows = [(_week_id(monday_sel), d.isoformat(), tit, sup) for d, (tit, sup) in sched.items()]
-                _save_tirages(rows)
+                if "rng" not in st.session_state:
+                    st.session_state.rng = random.Random()
+                sched = _draw_week(elig, monday_sel, st.session_state.rng)
+                rows = [(wid_sel, d, tit, sup) for d, (tit, sup) in sched.items()]
+                wb = _open_wb(); _save_tirages(wb, rows)
                 dm: Dict[str, List[str]] = {}
                 for d, (tit, _) in sched.items():
                     dm.setdefault(tit, []).append(d.isoformat())
-                _update_dates(players, dm)
+                _update_dates(wb, dm); _save_wb(wb)
                 st.sidebar.success("Semaine enregistrée ✅"); _rerun()
 else:
     st.sidebar.info("Toutes les semaines futures sont déjà tirées.")
@@ -227,44 +379,47 @@ with st.sidebar.form("reset_form"):
 
 # ---- Affichage historique --------------------------------------------------
 
+def _week_block(idx: int, wid: str, wk: pd.DataFrame):
+    wk = wk.copy()
+    raw = [None if pd.isna(v) else v for v in wk["Date"]]
+    days = [_as_date(v) or v for v in raw]
+    labels = [_day_label(d) if isinstance(d, dt.date) else str(d or "") for d in days]
+    day_by_label = dict(zip(labels, days))
+    wk["Date"] = labels; wk.set_index("Date", inplace=True)
+    with st.expander(f"Semaine {wid}"):
+        with st.form(f"form_{idx}_{wid}"):
+            edited = _data_editor(wk, key=f"ed_{idx}_{wid}")
+            save = st.form_submit_button("💾 Enregistrer")
+        if save:
+            new_rows=[]; date_map: Dict[str,List[str]]={}
+            for date_str,tit,sup in edited[["Titulaire","Suppléant"]].itertuples(name=None):
+                d=day_by_label[date_str]
+                new_rows.append((wid,d,tit,sup))
+                if isinstance(d, dt.date):
+                    date_map.setdefault(tit, []).append(d.isoformat())
+            mon=dt.datetime.strptime(wid+"-1","%G-W%V-%u").date()
+            wb = _open_wb(); changed = _replace_week(_tirages_ws(wb), wid, new_rows)
+            if _update_dates(wb, date_map, set(_week_dates(mon))) or changed:
+                _save_wb(wb)
+                st.success("Modifications sauvegardées ✔️"); _rerun()
+            else:
+                st.info("Aucune modification.")
+
+
 st.subheader("Historique des semaines tirées")
-all_tir = _tirages_df()
 if all_tir.empty:
     st.info("Aucun tirage enregistré pour l'instant.")
 else:
-    seen = set(); uniq_weeks = []
-    for w in all_tir["Semaine"].astype(str).str.strip():
-        if w not in seen:
-            seen.add(w); uniq_weeks.append(w)
-    for idx, wid in enumerate(sorted(uniq_weeks)):
-        wk = all_tir[all_tir["Semaine"].astype(str).str.strip() == wid][["Date","Titulaire","Suppléant"]].copy()
-        wk["Date"] = pd.to_datetime(wk["Date"]).dt.strftime("%A %d/%m/%Y"); wk.set_index("Date", inplace=True)
-        with st.expander(f"Semaine {wid}"):
-            edited = _data_editor(wk, key=f"ed_{idx}_{wid}")
-            if st.button("💾 Enregistrer", key=f"save_{idx}_{wid}"):
-                wb = _open_wb(); ws = wb[TIRAGES_SHEET]
-                rows_del=[i for i,row in enumerate(ws.iter_rows(values_only=True),start=1) if i>1 and str(row[0]).strip()==wid]
-                for i in reversed(rows_del):
-                    ws.delete_rows(i)
-                date_map: Dict[str,List[str]]={}
-                for date_str,row in edited.iterrows():
-                    iso=dt.datetime.strptime(date_str,"%A %d/%m/%Y").date().isoformat()
-                    ws.append([wid,iso,row["Titulaire"],row["Suppléant"]])
-                    date_map.setdefault(row["Titulaire"], []).append(iso)
-                wb.save(DATA_FILE)
-                mon=dt.datetime.strptime(wid+"-1","%Y-W%W-%w").date(); week_dates={mon+dt.timedelta(i) for i in range(7)}
-                players["Date du train"] = players["Date du train"].apply(lambda x:_strip_week(str(x),week_dates))
-                _update_dates(players,date_map)
-                st.success("Modifications sauvegardées ✔️"); _rerun()
+    for idx, (wid, wk) in enumerate(all_tir.groupby("Semaine", sort=True)):
+        _week_block(idx, wid, wk[["Date","Titulaire","Suppléant"]])
 
 # ---- Téléchargement -------------------------------------------------------
 
-with open(DATA_FILE, "rb") as f:
-    st.download_button(
-        label="📥 Télécharger le fichier Excel mis à jour",
-        data=f.read(),
-        file_name=DATA_FILE.name,
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
+st.download_button(
+    label="📥 Télécharger le fichier Excel mis à jour",
+    data=_file_bytes(*file_key),
+    file_name=DATA_FILE.name,
+    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+)
 
 # Fin de l'app